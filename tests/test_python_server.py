@@ -6,6 +6,7 @@ import pytest
 import asyncio
 import json
 import tempfile
+import aiofiles
 import os
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -60,6 +61,31 @@ class TestMCPServer:
             assert test_file.exists()
             assert test_file.read_text() == "Hello, MCP!"
     
+    @pytest.mark.asyncio
+    async def test_write_file_concurrent(self, temp_data_dir):
+        """Test that concurrent writes to one path leave the last content on disk"""
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_call_tool
+            
+            results = await asyncio.gather(*(
+                handle_call_tool("write_file", {"path": "test.txt", "content": f"version {i}"})
+                for i in range(5)
+            ))
+            
+            assert all("Successfully wrote 9 characters" in r[0].text for r in results)
+            assert (temp_data_dir / "test.txt").read_text() == "version 4"
+            
+            # Different spellings of the same file share one flush
+            paths = ["test.txt", "./sub/../test.txt", "sub/../test.txt", "./test.txt"]
+            with patch('src.main.aiofiles.open', wraps=aiofiles.open) as opened:
+                await asyncio.gather(*(
+                    handle_call_tool("write_file", {"path": p, "content": f"spelling {i}"})
+                    for i, p in enumerate(paths)
+                ))
+            
+            assert (temp_data_dir / "test.txt").read_text() == "spelling 3"
+            assert opened.call_count <= 2
+    
     @pytest.mark.asyncio
     async def test_list_directory_tool(self, temp_data_dir):
         """Test the list_directory tool"""
@@ -110,6 +136,34 @@ class TestMCPServer:
             assert len(result) == 1
             assert "Cache value for 'test_key': test_value" in result[0].text
     
+    @pytest.mark.asyncio
+    async def test_cache_batch_operations(self, mock_redis_client):
+        """Test pipelined Redis cache operations"""
+        pipe = MagicMock()
+        pipe.__aenter__.return_value = pipe
+        pipe.execute = AsyncMock(return_value=[True, True])
+        mock_redis_client.pipeline = MagicMock(return_value=pipe)
+        mock_redis_client.mget.return_value = ["v1", None]
+        
+        with patch('src.main.redis_client', mock_redis_client):
+            from src.main import handle_call_tool
+            
+            result = await handle_call_tool("cache_mset", {
+                "items": [{"key": "k1", "value": "v1"}, {"key": "k2", "value": "v2"}],
+                "ttl": 60
+            })
+            
+            assert "Set 2 cache keys with TTL 60" in result[0].text
+            mock_redis_client.pipeline.assert_called_once_with(transaction=False)
+            pipe.setex.assert_any_call("k1", 60, "v1")
+            pipe.setex.assert_any_call("k2", 60, "v2")
+            pipe.execute.assert_awaited_once()
+            
+            result = await handle_call_tool("cache_mget", {"keys": ["k1", "k2"]})
+            
+            assert json.loads(result[0].text) == {"k1": "v1", "k2": None}
+            mock_redis_client.mget.assert_called_once_with(["k1", "k2"])
+    
     @pytest.mark.asyncio
     async def test_analyze_data_tool(self, temp_data_dir):
         """Test the analyze_data tool with CSV files"""
@@ -138,6 +192,271 @@ Bob,35,Sales"""
             assert "age" in content
             assert "department" in content
     
+    @pytest.mark.asyncio
+    async def test_analyze_data_wide_table(self, temp_data_dir):
+        """Test that head/describe text keeps every column and whole cells"""
+        header = ",".join(f"c{i}" for i in range(15))
+        rows = "\n".join(",".join(f"{r * 100 + i}.34084{i}" for i in range(15)) for r in range(12))
+        (temp_data_dir / "wide.csv").write_text(f"{header}\n{rows}\n")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_call_tool
+            
+            for analysis_type in ["head", "describe"]:
+                result = await handle_call_tool("analyze_data", {
+                    "file_path": "wide.csv",
+                    "analysis_type": analysis_type
+                })
+                
+                content = result[0].text
+                assert "…" not in content
+                assert all(f"c{i} " in content for i in range(15))
+            
+            assert "null_count" in content
+            head = await handle_call_tool("analyze_data", {"file_path": "wide.csv", "analysis_type": "head"})
+            assert "907.340847" in head[0].text
+    
+    @pytest.mark.asyncio
+    async def test_analyze_data_summary_quoted(self, temp_data_dir):
+        """Test that summaries of quoted CSVs fall back to the full parser"""
+        (temp_data_dir / "plain.csv").write_text("a,b\n1,2\n3,4\n")
+        (temp_data_dir / "quoted.csv").write_text('a,b\n"x\ny",2\n"p,q",4\n')
+        
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_call_tool
+            
+            result = await handle_call_tool("analyze_data", {"file_path": "plain.csv"})
+            assert "Shape: (2, 2)" in result[0].text
+            assert "Data types (sampled)" in result[0].text
+            
+            result = await handle_call_tool("analyze_data", {"file_path": "quoted.csv"})
+            assert "Shape: (2, 2)" in result[0].text
+            assert "Data types (sampled)" not in result[0].text
+    
+    @pytest.mark.asyncio
+    async def test_analyze_data_arrow_output(self, temp_data_dir):
+        """Test returning head rows as an Arrow IPC stream"""
+        import base64
+        import polars as pl
+        
+        (temp_data_dir / "test.csv").write_text("name,age\nJohn,30\nJane,25")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_call_tool
+            
+            result = await handle_call_tool("analyze_data", {
+                "file_path": "test.csv",
+                "analysis_type": "head",
+                "output_format": "arrow"
+            })
+            
+            assert len(result) == 1
+            assert result[0].resource.mimeType == "application/vnd.apache.arrow.stream"
+            df = pl.read_ipc_stream(base64.b64decode(result[0].resource.blob))
+            assert df.columns == ["name", "age"]
+            assert df["age"].to_list() == [30, 25]
+            assert str(result[0].resource.uri).endswith("test.csv#head.arrow")
+            
+            with patch('src.main.USE_POLARS', False):
+                result = await handle_call_tool("analyze_data", {
+                    "file_path": "test.csv",
+                    "analysis_type": "head",
+                    "output_format": "arrow"
+                })
+                assert result[0].text == "Arrow output requires polars, which is not enabled"
+    
+    @pytest.mark.asyncio
+    async def test_analyze_data_summary_blank_lines_and_bom(self, temp_data_dir):
+        """Test that the summary fast path skips blank lines and strips a UTF-8 BOM"""
+        (temp_data_dir / "blank.csv").write_text("a,b\n1,2\n\n3,4\n\n")
+        (temp_data_dir / "crlf.csv").write_bytes(b"a,b\r\n1,2\r\n\r\n3,4\r\n")
+        (temp_data_dir / "bom.csv").write_bytes(b"\xef\xbb\xbfa,b\n1,2\n")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_call_tool
+            
+            for name in ["blank.csv", "crlf.csv"]:
+                result = await handle_call_tool("analyze_data", {"file_path": name})
+                assert "Shape: (2, 2)" in result[0].text
+            
+            result = await handle_call_tool("analyze_data", {"file_path": "bom.csv"})
+            assert "Shape: (1, 2)" in result[0].text
+            assert "Columns: ['a', 'b']" in result[0].text
+    
+    @pytest.mark.asyncio
+    async def test_analyze_data_late_type_change(self, temp_data_dir):
+        """Test CSVs whose column type changes after polars' default inference window"""
+        rows = "".join(f"{i},x\n" for i in range(200))
+        (temp_data_dir / "late.csv").write_text(f"a,b\n{rows}1.5,y\n")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_call_tool
+            
+            for analysis_type in ["summary", "head", "info", "describe"]:
+                result = await handle_call_tool("analyze_data", {
+                    "file_path": "late.csv",
+                    "analysis_type": analysis_type
+                })
+                assert "Error analyzing data" not in result[0].text
+            
+            # Past the configured window, the pandas path takes over
+            with patch('src.main.INFER_SCHEMA_LENGTH', 50):
+                result = await handle_call_tool("analyze_data", {
+                    "file_path": "late.csv",
+                    "analysis_type": "head"
+                })
+                assert "Error analyzing data" not in result[0].text
+                assert "First 10 rows of late.csv" in result[0].text
+    
+    @pytest.mark.asyncio
+    async def test_analyze_data_pandas_fallback(self, temp_data_dir):
+        """Test the analyze_data tool when polars is disabled"""
+        csv_file = temp_data_dir / "test.csv"
+        csv_file.write_text("name,age\nJohn,30\nJane,25")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir), patch('src.main.USE_POLARS', False):
+            from src.main import handle_call_tool
+            
+            result = await handle_call_tool("analyze_data", {
+                "file_path": "test.csv",
+                "analysis_type": "summary"
+            })
+            
+            assert len(result) == 1
+            assert "Shape: (2, 2)" in result[0].text
+            assert "['name', 'age']" in result[0].text
+    
+    @pytest.mark.asyncio
+    async def test_execute_sql_tool(self, mock_db_pool):
+        """Test the execute_sql tool against a pooled connection"""
+        stmt = MagicMock()
+        stmt.get_attributes.return_value = ("id", "username")
+        con = AsyncMock()
+        con.fetch_prepared.return_value = (stmt, [{"id": 1, "username": "john"}])
+        mock_db_pool.acquire.return_value.__aenter__.return_value = con
+        
+        with patch('src.main.db_pool', mock_db_pool):
+            from src.main import handle_call_tool
+            
+            result = await handle_call_tool("execute_sql", {
+                "query": "SELECT * FROM users WHERE department = $1",
+                "parameters": ["Engineering"]
+            })
+            
+            assert len(result) == 1
+            assert json.loads(result[0].text) == [{"id": 1, "username": "john"}]
+            con.fetch_prepared.assert_called_once_with(
+                "SELECT * FROM users WHERE department = $1", "Engineering"
+            )
+            
+            # Typed parameters pass through unchanged for non-text placeholders
+            await handle_call_tool("execute_sql", {
+                "query": "SELECT * FROM products WHERE is_active = $1 AND stock_quantity > $2",
+                "parameters": [True, 5]
+            })
+            con.fetch_prepared.assert_called_with(
+                "SELECT * FROM products WHERE is_active = $1 AND stock_quantity > $2", True, 5
+            )
+    
+    @pytest.mark.asyncio
+    async def test_fetch_prepared_retries_stale_statement(self):
+        """Test that a statement invalidated by a schema change is re-prepared once"""
+        import asyncpg
+        from src.main import CachedStatementConnection
+        
+        stale, fresh = AsyncMock(), AsyncMock()
+        stale.fetch.side_effect = asyncpg.InvalidCachedStatementError("cached plan must not change result type")
+        fresh.fetch.return_value = [{"id": 1}]
+        stale.get_parameters = fresh.get_parameters = MagicMock(return_value=())
+        con = AsyncMock()
+        con._prepare.side_effect = [stale, fresh]
+        con.is_in_transaction = MagicMock(return_value=False)
+        
+        stmt, rows = await CachedStatementConnection.fetch_prepared(con, "SELECT * FROM users")
+        
+        assert stmt is fresh
+        assert rows == [{"id": 1}]
+        con.reload_schema_state.assert_awaited_once()
+        
+        # Inside a transaction the error must surface instead
+        con._prepare.side_effect = [stale]
+        con.is_in_transaction.return_value = True
+        with pytest.raises(asyncpg.InvalidCachedStatementError):
+            await CachedStatementConnection.fetch_prepared(con, "SELECT * FROM users")
+    
+    def test_coerce_params(self):
+        """Test that string arguments are converted to their placeholder types"""
+        import datetime
+        import decimal
+        import uuid
+        from types import SimpleNamespace
+        from src.main import coerce_params
+        
+        types = [SimpleNamespace(name=n) for n in ("int4", "numeric", "bool", "timestamptz", "uuid", "text", "int8")]
+        args = ("5", "19.99", "false", "2024-01-15T10:30:00+00:00",
+                "12345678-1234-5678-1234-567812345678", "42", 7)
+        
+        assert coerce_params(types, args) == (
+            5, decimal.Decimal("19.99"), False,
+            datetime.datetime(2024, 1, 15, 10, 30, tzinfo=datetime.timezone.utc),
+            uuid.UUID("12345678-1234-5678-1234-567812345678"), "42", 7,
+        )
+        with pytest.raises(ValueError):
+            coerce_params(types[2:3], ("maybe",))
+    
+    @pytest.mark.asyncio
+    async def test_serve_health_startup_failure(self):
+        """Test that a health server that cannot bind does not raise into the MCP loop"""
+        from src.main import serve_health
+        
+        for error in (SystemExit(3), OSError(98, "Address already in use")):
+            health_server = MagicMock()
+            health_server.serve = AsyncMock(side_effect=error)
+            await serve_health(health_server)
+            health_server.serve.assert_awaited_once()
+    
+    def test_rows_to_json(self):
+        """Test JSON serialization of database rows"""
+        import datetime
+        import decimal
+        import uuid
+        from src.main import rows_to_json
+        
+        row_id = uuid.uuid4()
+        rows = [{
+            "id": row_id,
+            "price": decimal.Decimal("19.99"),
+            "created_at": datetime.datetime(2024, 1, 2, 3, 4, 5)
+        }]
+        
+        assert json.loads(rows_to_json(rows)) == [{
+            "id": str(row_id),
+            "price": "19.99",
+            "created_at": "2024-01-02T03:04:05+00:00"
+        }]
+    
+    @pytest.mark.asyncio
+    async def test_jsonb_columns_decoded(self):
+        """Test that json/jsonb values are serialized as nested objects, not strings"""
+        from src.main import init_db_connection, rows_to_json
+        
+        con = AsyncMock()
+        await init_db_connection(con)
+        
+        codecs = {c.args[0]: c.kwargs for c in con.set_type_codec.call_args_list}
+        assert set(codecs) == {"json", "jsonb"}
+        assert all(kw["schema"] == "pg_catalog" for kw in codecs.values())
+        
+        decode = codecs["jsonb"]["decoder"]
+        rows = [{"event_type": "page_view", "event_data": decode('{"page": "/home", "ms": 120}')}]
+        assert json.loads(rows_to_json(rows)) == [
+            {"event_type": "page_view", "event_data": {"page": "/home", "ms": 120}}
+        ]
+        
+        encode = codecs["jsonb"]["encoder"]
+        assert encode({"a": 1}) == '{"a":1}'
+        assert encode('{"a": 1}') == '{"a": 1}'
+    
     @pytest.mark.asyncio
     async def test_unknown_tool_error(self):
         """Test that unknown tools raise appropriate errors"""
@@ -146,6 +465,28 @@ Bob,35,Sales"""
         with pytest.raises(ValueError, match="Unknown tool: nonexistent_tool"):
             await handle_call_tool("nonexistent_tool", {})
 
+    @pytest.mark.asyncio
+    async def test_invalid_arguments_error(self):
+        """Test that arguments are validated against the tool's input schema"""
+        from src.main import handle_call_tool
+        
+        with pytest.raises(ValueError, match="Invalid arguments for cache_set"):
+            await handle_call_tool("cache_set", {"key": "test_key"})
+
+    @pytest.mark.asyncio
+    async def test_warm_connections(self, mock_db_pool, mock_redis_client):
+        """Test that keepalive pings Redis and touches min_size pooled connections"""
+        mock_db_pool.get_min_size.return_value = 3
+        mock_db_pool.execute = AsyncMock()
+        
+        with patch('src.main.db_pool', mock_db_pool), patch('src.main.redis_client', mock_redis_client):
+            from src.main import warm_connections
+            
+            await warm_connections()
+            
+            mock_redis_client.ping.assert_awaited_once()
+            assert mock_db_pool.execute.await_count == 3
+
 class TestResourceHandling:
     """Test cases for resource handling"""
     
@@ -162,14 +503,48 @@ class TestResourceHandling:
             resources = await handle_list_resources()
             
             # Should find the files we created
-            file_resources = [r for r in resources if r.uri.startswith("file://")]
+            file_resources = [r for r in resources if str(r.uri).startswith("file://")]
             assert len(file_resources) >= 2
             
             # Check file URIs are correct
-            uris = [r.uri for r in file_resources]
+            uris = [str(r.uri) for r in file_resources]
             assert any("test1.txt" in uri for uri in uris)
             assert any("test2.csv" in uri for uri in uris)
     
+    @pytest.mark.asyncio
+    async def test_list_resources_nested(self, temp_data_dir):
+        """Test that files in subdirectories are listed with relative descriptions"""
+        (temp_data_dir / "reports").mkdir()
+        (temp_data_dir / "reports" / "q1.csv").write_text("a,b\n1,2")
+        (temp_data_dir / "reports" / "blob.bin").write_bytes(b"\x00")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_list_resources
+            
+            resources = {r.name: r for r in await handle_list_resources()}
+            
+            assert resources["q1.csv"].description == "File: reports/q1.csv"
+            assert resources["q1.csv"].mimeType == "text/plain"
+            assert resources["blob.bin"].mimeType == "application/octet-stream"
+    
+    @pytest.mark.asyncio
+    async def test_list_resources_cached(self, temp_data_dir, mock_redis_client):
+        """Test that a matching Redis listing is served without rescanning"""
+        cached_uri = f"file://{temp_data_dir}/cached.txt"
+        mock_redis_client.get.return_value = json.dumps({
+            "root": str(temp_data_dir),
+            "mtime_ns": temp_data_dir.stat().st_mtime_ns,
+            "entries": [[cached_uri, "cached.txt", "File: cached.txt", "text/plain"]]
+        })
+        
+        with patch('src.main.DATA_DIR', temp_data_dir), patch('src.main.redis_client', mock_redis_client):
+            from src.main import handle_list_resources
+            
+            resources = await handle_list_resources()
+            
+            assert [str(r.uri) for r in resources] == [cached_uri]
+            mock_redis_client.set.assert_not_called()
+    
     @pytest.mark.asyncio
     async def test_read_file_resource(self, temp_data_dir):
         """Test reading file resources"""
@@ -178,10 +553,61 @@ class TestResourceHandling:
         test_content = "This is test content"
         test_file.write_text(test_content)
         
-        from src.main import handle_read_resource
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_read_resource
+            
+            content = await handle_read_resource(f"file://{test_file}")
+            assert content == test_content
+    
+    @pytest.mark.asyncio
+    async def test_read_table_resource(self, mock_db_pool):
+        """Test reading database table resources"""
+        con = AsyncMock()
+        con.fetch.return_value = [{"id": 1, "name": "Widget"}]
+        mock_db_pool.acquire.return_value.__aenter__.return_value = con
         
-        content = await handle_read_resource(f"file://{test_file}")
-        assert content == test_content
+        with patch('src.main.db_pool', mock_db_pool):
+            from src.main import handle_read_resource
+            
+            content = await handle_read_resource("db://table/products")
+            assert json.loads(content) == [{"id": 1, "name": "Widget"}]
+            con.fetch.assert_called_once_with('SELECT * FROM "products" LIMIT 100')
+            
+            with pytest.raises(ValueError, match="Invalid table name"):
+                await handle_read_resource("db://table/users; DROP TABLE users")
+    
+    @pytest.mark.asyncio
+    async def test_read_large_and_binary_resources(self, temp_data_dir):
+        """Test chunked reads of large files and bytes for binary content"""
+        large_file = temp_data_dir / "large.txt"
+        large_content = "0123456789abcdef" * 100000
+        large_file.write_text(large_content)
+        binary_file = temp_data_dir / "image.bin"
+        binary_file.write_bytes(b"\x89PNG\xff\x00")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir):
+            from src.main import handle_read_resource
+            
+            assert await handle_read_resource(f"file://{large_file}") == large_content
+            assert await handle_read_resource(f"file://{binary_file}") == b"\x89PNG\xff\x00"
+            
+            # Non-UTF-8 content with a text suffix is returned as bytes regardless of size
+            latin1_file = temp_data_dir / "latin1.csv"
+            latin1_file.write_bytes("name\nJos\u00e9\n".encode("latin-1"))
+            assert await handle_read_resource(f"file://{latin1_file}") == b"name\nJos\xe9\n"
+    
+    @pytest.mark.asyncio
+    async def test_read_resource_outside_data_dir(self, temp_data_dir):
+        """Test that file resources outside the data directory are rejected"""
+        (temp_data_dir / "data").mkdir()
+        secret = temp_data_dir / "secret.txt"
+        secret.write_text("secret")
+        
+        with patch('src.main.DATA_DIR', temp_data_dir / "data"):
+            from src.main import handle_read_resource
+            
+            with pytest.raises(ValueError, match="Access denied"):
+                await handle_read_resource(f"file://{temp_data_dir}/data/../secret.txt")
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file